@@ -1,10 +1,29 @@
+import logging
+import queue
 import uvicorn
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from .config import Settings
 from .api import app
 
+def configure_logging(level: int = logging.INFO) -> QueueListener:
+    """Route log records through a queue so handler I/O runs on a background thread."""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
 def main():
     """Main entry point for the MCP RAG server."""
+    listener = configure_logging()
+    
     # Load settings
     settings = Settings()
     
@@ -13,12 +32,15 @@ def main():
     Path(settings.chroma_db_dir).mkdir(parents=True, exist_ok=True)
     
     # Run server
-    uvicorn.run(
-        app,
-        host=settings.host,
-        port=settings.port,
-        log_level="info"
-    )
+    try:
+        uvicorn.run(
+            app,
+            host=settings.host,
+            port=settings.port,
+            log_level="info"
+        )
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,17 +1,23 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
 import asyncio
+import itertools
+import uuid
+from collections import defaultdict
 from pathlib import Path
 from pydantic import BaseModel
+import numpy as np
 
 from .config import Settings
 from .document_processor import DocumentProcessor
+from .query_cache import QueryCache
 from .vector_store import VectorStore
 
 # Request/Response Models
 class ProcessDirectoryRequest(BaseModel):
     directory: str
+    ingest_mode: Literal["sync", "batch"] = "sync"
 
 class GenerateContextRequest(BaseModel):
     query: str
@@ -42,8 +48,27 @@ app.add_middleware(
 )
 
 # Initialize services
-document_processor = DocumentProcessor(settings.openai_api_key)
-vector_store = VectorStore(settings.chroma_db_dir)
+document_processor = DocumentProcessor(
+    settings.openai_api_key,
+    cache_dir=settings.embedding_cache_dir,
+    chunk_size_tokens=settings.chunk_size_tokens,
+    chunk_overlap_tokens=settings.chunk_overlap_tokens,
+    embedding_max_attempts=settings.embedding_max_attempts
+)
+vector_store = VectorStore(
+    settings.chroma_db_dir,
+    hnsw_m=settings.hnsw_m,
+    hnsw_ef_construction=settings.hnsw_ef_construction,
+    hnsw_ef_search=settings.hnsw_ef_search
+)
+query_cache = QueryCache(
+    max_size=settings.query_cache_size,
+    ttl=settings.query_cache_ttl,
+    similarity_threshold=settings.semantic_cache_threshold
+)
+
+# Status of background batch ingest jobs, by job id
+ingest_jobs: Dict[str, Dict[str, Any]] = {}
 
 async def get_document_processor():
     """Dependency for document processor."""
@@ -53,33 +78,76 @@ async def get_vector_store():
     """Dependency for vector store."""
     return vector_store
 
+async def get_query_cache():
+    """Dependency for query cache."""
+    return query_cache
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
 
+async def store_results(
+    results: List[Dict[str, Any]],
+    store: VectorStore,
+    cache: QueryCache
+):
+    """Store processed files in the vector store with a single batched write."""
+    chunks = list(itertools.chain.from_iterable(r["chunks"] for r in results))
+    if chunks:
+        await store.aadd_documents(
+            chunks=chunks,
+            embeddings=np.concatenate([r["embeddings"] for r in results]),
+            metadata=list(itertools.chain.from_iterable(r["metadata"] for r in results))
+        )
+        cache.clear_results()
+
+async def run_batch_ingest(
+    job_id: str,
+    directory: str,
+    doc_processor: DocumentProcessor,
+    store: VectorStore,
+    cache: QueryCache
+):
+    """Process a directory through the Batch API and record the job outcome."""
+    try:
+        results = await doc_processor.process_directory(directory, ingest_mode="batch")
+        await store_results(results, store, cache)
+        ingest_jobs[job_id] = {"status": "completed", "processed_files": len(results)}
+    except Exception as e:
+        ingest_jobs[job_id] = {"status": "failed", "error": str(e)}
+
 @app.post("/documents/process")
 async def process_documents(
     request: ProcessDirectoryRequest,
+    response: Response,
+    background_tasks: BackgroundTasks,
     doc_processor: DocumentProcessor = Depends(get_document_processor),
-    store: VectorStore = Depends(get_vector_store)
+    store: VectorStore = Depends(get_vector_store),
+    cache: QueryCache = Depends(get_query_cache)
 ):
-    """Process all markdown files in a directory."""
+    """Process all markdown files in a directory.
+
+    Batch API jobs can take up to 24 hours, so ``ingest_mode="batch"`` runs in
+    the background and returns a job id to poll at ``/documents/jobs/{job_id}``.
+    """
     try:
         # Ensure directory exists
         if not Path(request.directory).exists():
             raise HTTPException(status_code=404, detail="Directory not found")
+        
+        if request.ingest_mode == "batch":
+            job_id = uuid.uuid4().hex
+            ingest_jobs[job_id] = {"status": "running"}
+            background_tasks.add_task(
+                run_batch_ingest, job_id, request.directory, doc_processor, store, cache
+            )
+            response.status_code = 202
+            return {"status": "accepted", "job_id": job_id}
             
         # Process documents
         results = await doc_processor.process_directory(request.directory)
-        
-        # Store in vector store
-        for result in results:
-            store.add_documents(
-                chunks=result["chunks"],
-                embeddings=result["embeddings"],
-                metadata=result["metadata"]
-            )
+        await store_results(results, store, cache)
             
         return {
             "status": "success",
@@ -89,38 +157,51 @@ async def process_documents(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/documents/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Get the status of a background batch ingest job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, **job}
+
 @app.post("/context/generate", response_model=GenerateContextResponse)
 async def generate_context(
     request: GenerateContextRequest,
     doc_processor: DocumentProcessor = Depends(get_document_processor),
-    store: VectorStore = Depends(get_vector_store)
+    store: VectorStore = Depends(get_vector_store),
+    cache: QueryCache = Depends(get_query_cache)
 ):
     """Generate context for a query using RAG."""
     try:
-        # Generate embedding for query
-        query_embedding = await doc_processor.generate_embeddings([request.query])
-        
-        if not query_embedding:
-            raise HTTPException(status_code=500, detail="Failed to generate query embedding")
+        # Generate embedding for query, reusing a cached one when possible
+        query_embedding = cache.get_embedding(request.query)
+        if query_embedding is None:
+            embeddings = await doc_processor.generate_embeddings([request.query])
             
-        # Search for similar contexts
-        results = store.search_similar(
-            query_embedding=query_embedding[0],
-            n_results=request.n_results
-        )
+            if len(embeddings) == 0:
+                raise HTTPException(status_code=500, detail="Failed to generate query embedding")
+            
+            query_embedding = embeddings[0]
+            cache.put_embedding(request.query, query_embedding)
+            
+        # Search for similar contexts unless a near-identical query was answered recently
+        results = cache.get_results(query_embedding, request.n_results)
+        if results is None:
+            # A write that lands during the search invalidates its results
+            generation = cache.generation
+            results = await store.asearch_similar(
+                query_embedding=query_embedding,
+                n_results=request.n_results
+            )
+            cache.put_results(query_embedding, request.n_results, results, generation)
         
-        # Format response
-        contexts = []
-        for i, (doc, meta, distance) in enumerate(zip(
-            results["documents"],
-            results["metadatas"],
-            results["distances"]
-        )):
-            contexts.append(Context(
-                content=doc,
-                metadata=meta,
-                relevance_score=1 - distance  # Convert distance to similarity score
-            ))
+        # Format response, converting all distances to similarity scores at once
+        scores = (1.0 - np.asarray(results["distances"], dtype=np.float64)).tolist()
+        contexts = [
+            Context(content=doc, metadata=meta, relevance_score=score)
+            for doc, meta, score in zip(results["documents"], results["metadatas"], scores)
+        ]
             
         return GenerateContextResponse(
             query=request.query,
@@ -132,26 +213,29 @@ async def generate_context(
 
 @app.get("/documents/list")
 async def list_documents(
+    include_content: bool = False,
     store: VectorStore = Depends(get_vector_store)
 ):
-    """List all processed documents."""
+    """List all processed documents.
+
+    Chunk content is only returned when ``include_content`` is set.
+    """
     try:
-        # Get all documents from the collection
-        results = store.collection.get()
+        results = await store.alist_chunks(include_content=include_content)
+        contents = results["documents"] if include_content else itertools.repeat(None)
         
         # Group by source file
-        documents = {}
-        for doc, meta in zip(results["documents"], results["metadatas"]):
-            source = meta["source"]
-            if source not in documents:
-                documents[source] = {
-                    "chunks": [],
-                    "last_updated": meta["last_updated"]
-                }
-            documents[source]["chunks"].append({
-                "content": doc,
-                "chunk_index": meta["chunk_index"]
-            })
+        documents = defaultdict(lambda: {"chunks": [], "last_updated": None})
+        for meta, content in zip(results["metadatas"], contents):
+            document = documents[meta["source"]]
+            document["last_updated"] = meta["last_updated"]
+            chunk = {"chunk_index": meta["chunk_index"]}
+            if include_content:
+                chunk["content"] = content
+            document["chunks"].append(chunk)
+        
+        for document in documents.values():
+            document["chunks"].sort(key=lambda chunk: chunk["chunk_index"])
             
         return {"documents": documents}
         
@@ -161,19 +245,14 @@ async def list_documents(
 @app.delete("/documents/{source}")
 async def delete_document(
     source: str,
-    store: VectorStore = Depends(get_vector_store)
+    store: VectorStore = Depends(get_vector_store),
+    cache: QueryCache = Depends(get_query_cache)
 ):
     """Delete all chunks from a specific source document."""
     try:
-        # Get all documents
-        results = store.collection.get()
-        
-        # Find and delete chunks from the source
-        deleted = 0
-        for doc_id, meta in zip(results["ids"], results["metadatas"]):
-            if meta["source"] == source:
-                store.delete_document(doc_id)
-                deleted += 1
+        deleted = await store.adelete_by_source(source)
+        if deleted:
+            cache.clear_results()
                 
         return {
             "status": "success",
@@ -185,15 +264,16 @@ async def delete_document(
     
 @app.delete("/documents/clear")
 async def clear_all_documents(
-    store: VectorStore = Depends(get_vector_store)
+    store: VectorStore = Depends(get_vector_store),
+    cache: QueryCache = Depends(get_query_cache)
 ):
     """Clear all documents from the vector store."""
     try:
-        store.clear_collection()
+        await store.aclear_collection()
+        cache.clear_results()
         
         # Verify that the collection is empty
-        results = store.collection.get()
-        if results["ids"]:
+        if await store.acount():
             raise HTTPException(status_code=500, detail="Failed to clear all documents")
         
         return {"status": "success", "message": "All documents cleared"}
@@ -210,7 +290,7 @@ async def list_collections_and_embeddings(
 ):
     """List all collections and embeddings within each collection."""
     try:
-        result = store.list_collections_and_embeddings()
+        result = await store.alist_collections_and_embeddings()
         return {"status": "success", "collections": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing collections and embeddings: {str(e)}")
@@ -221,18 +301,20 @@ async def list_collections(
 ):
     """List all collections in the vector store."""
     try:
-        collections = store.list_collections()
+        collections = await store.alist_collections()
         return {"status": "success", "collections": collections}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing collections: {str(e)}")
 
 @app.delete("/embeddings/clear")
 async def clear_all_embeddings(
-    store: VectorStore = Depends(get_vector_store)
+    store: VectorStore = Depends(get_vector_store),
+    cache: QueryCache = Depends(get_query_cache)
 ):
     """Clear all embeddings from all collections in the vector store."""
     try:
-        store.clear_all_embeddings()
+        await store.aclear_all_embeddings()
+        cache.clear_results()
         return {"status": "success", "message": "All embeddings cleared from all collections"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error clearing all embeddings: {str(e)}")
\ No newline at end of file
@@ -12,6 +12,22 @@ class Settings(BaseSettings):
     
     # ChromaDB configuration
     chroma_db_dir: str = "./chroma_db"
+    hnsw_m: int = 24
+    hnsw_ef_construction: int = 128
+    hnsw_ef_search: int = 100
+    
+    # Embedding configuration
+    embedding_cache_dir: str = "./embedding_cache"
+    embedding_max_attempts: int = 6
+    
+    # Chunking configuration (chunk by characters unless a token size is set)
+    chunk_size_tokens: Optional[int] = None
+    chunk_overlap_tokens: int = 200
+    
+    # Query cache configuration
+    query_cache_size: int = 10000
+    query_cache_ttl: float = 3600
+    semantic_cache_threshold: float = 0.97
     
     # Server configuration
     host: str = "0.0.0.0"
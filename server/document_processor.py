@@ -1,99 +1,510 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable, Awaitable
 import os
-from pathlib import Path
+import logging
+import json
+import hashlib
 import asyncio
-from openai import AsyncOpenAI
+import aiofiles
+import diskcache
+import numpy as np
+import tiktoken
+from openai import (
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    RateLimitError,
+    APIConnectionError,
+    InternalServerError
+)
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIMENSION = 1536
+# Maximum number of inputs sent in a single embeddings request
+EMBEDDING_BATCH_SIZE = 256
+# Embeddings endpoint token limits per input and per request
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+EMBEDDING_MAX_REQUEST_TOKENS = 300_000
+# Backoff between attempts of an embeddings or Batch API request that hit a transient error
+EMBEDDING_RETRY_WAIT = wait_exponential_jitter(initial=1, max=60)
+# Terminal states of an OpenAI Batch API job
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Batch API limits on the requests and input file size of a single job
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_FILE_BYTES = 200 * 1024 * 1024
 
 class DocumentProcessor:
-    def __init__(self, openai_api_key: str):
-        """Initialize the document processor with OpenAI client."""
-        self.client = AsyncOpenAI(api_key=openai_api_key)
+    def __init__(self,
+                 openai_api_key: str,
+                 embedding_concurrency: int = 8,
+                 file_concurrency: int = 8,
+                 cache_dir: Optional[str] = None,
+                 chunk_size_tokens: Optional[int] = None,
+                 chunk_overlap_tokens: int = 200,
+                 embedding_max_attempts: int = 6):
+        """Initialize the document processor with OpenAI client.
+
+        If ``cache_dir`` is given, embeddings are cached on disk keyed by a
+        hash of the model and chunk text, so unchanged chunks are not re-embedded.
+        If ``chunk_size_tokens`` is given, documents are chunked by embedding
+        model tokens instead of characters, and fewer chunks are sent per
+        request so each request stays within the endpoint's token limit.
+        Embedding and Batch API requests failing with rate limit, server or
+        connection errors are retried with exponential backoff, up to
+        ``embedding_max_attempts`` times.
+        """
+        if chunk_size_tokens:
+            if chunk_size_tokens > EMBEDDING_MAX_INPUT_TOKENS:
+                raise ValueError(
+                    f"chunk_size_tokens must be at most {EMBEDDING_MAX_INPUT_TOKENS}"
+                )
+            if not 0 <= chunk_overlap_tokens < chunk_size_tokens:
+                raise ValueError("chunk_overlap_tokens must be smaller than chunk_size_tokens")
+        # Multiplex concurrent embedding requests over HTTP/2. The SDK's client
+        # keeps its default timeout, pool limits and proxy settings from the
+        # environment.
+        self.http_client = DefaultAsyncHttpxClient(http2=True)
+        # Retries are handled by _request_with_retries rather than the client
+        self.client = AsyncOpenAI(api_key=openai_api_key, http_client=self.http_client, max_retries=0)
+        self.embedding_max_attempts = embedding_max_attempts
+        self.embedding_concurrency = embedding_concurrency
+        # Bounds embedding requests in flight across all concurrent calls
+        self._embedding_semaphore = asyncio.Semaphore(embedding_concurrency)
+        self.file_concurrency = file_concurrency
+        self.cache = diskcache.Cache(cache_dir) if cache_dir else None
         self.chunk_size = 1000
         self.chunk_overlap = 200
+        self.chunk_size_tokens = chunk_size_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.embedding_batch_size = EMBEDDING_BATCH_SIZE
+        if chunk_size_tokens:
+            self.embedding_batch_size = min(
+                EMBEDDING_BATCH_SIZE,
+                EMBEDDING_MAX_REQUEST_TOKENS // chunk_size_tokens
+            )
+        self._encoding = None
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        """Tokenizer of the embedding model, loaded on first use."""
+        if self._encoding is None:
+            self._encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        return self._encoding
 
     def chunk_document(self, content: str) -> List[str]:
         """Split document content into overlapping chunks."""
-        chunks = []
+        return list(self.iter_chunks(content))
+
+    def iter_chunks(self, content: str) -> Iterator[str]:
+        """Lazily yield overlapping chunks of document content."""
+        if self.chunk_size_tokens:
+            yield from self._iter_token_chunks(content)
+            return
+
+        # Documents that fit in one chunk need no break index
+        if len(content) <= self.chunk_size:
+            if content:
+                yield content
+            return
+
         start = 0
         
+        # Offsets of every period and newline, located once up front. UTF-32
+        # gives one array element per character, so offsets index ``content``.
+        codepoints = np.frombuffer(content.encode('utf-32-le'), dtype=np.uint32)
+        breaks = np.flatnonzero((codepoints == ord('.')) | (codepoints == ord('\n')))
+        
         while start < len(content):
             # Find the end of the chunk
             end = start + self.chunk_size
             
             if end >= len(content):
-                chunks.append(content[start:])
+                yield content[start:]
                 break
             
-            # Find the last period or newline in chunk_size range
-            last_period = content.rfind('.', start, end)
-            last_newline = content.rfind('\n', start, end)
-            split_point = max(last_period, last_newline)
-            
-            if split_point == -1 or split_point <= start:
+            # Find the last period or newline in chunk_size range, ignoring
+            # breaks so close to start that the overlap would not move past it
+            last_break = np.searchsorted(breaks, end) - 1
+            if last_break >= 0 and breaks[last_break] > start + self.chunk_overlap:
+                split_point = int(breaks[last_break])
+            else:
                 split_point = end
             
-            chunks.append(content[start:split_point])
+            yield content[start:split_point]
             start = split_point - self.chunk_overlap
+
+    def _iter_token_chunks(self, content: str) -> Iterator[str]:
+        """Lazily yield overlapping chunks of model tokens."""
+        tokens = self.encoding.encode(content)
+        stride = self.chunk_size_tokens - self.chunk_overlap_tokens
+        
+        for start in range(0, len(tokens), stride):
+            end = start + self.chunk_size_tokens
+            yield self.encoding.decode(tokens[start:end])
+            if end >= len(tokens):
+                break
+
+    def _empty_embeddings(self) -> np.ndarray:
+        """Embedding array for zero texts."""
+        return np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+
+    @staticmethod
+    def _cache_key(text: str) -> str:
+        """Content-addressed cache key for a chunk's embedding."""
+        return hashlib.sha256(f"{EMBEDDING_MODEL}\0{text}".encode("utf-8")).hexdigest()
+
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for a list of text chunks, using the cache if enabled.
+
+        Returns a ``(len(texts), dimension)`` float32 array.
+        """
+        if not texts:
+            return self._empty_embeddings()
+        if self.cache is None:
+            return await self._embed_texts(texts)
+
+        # The cache is SQLite-backed, so look up and store each call's keys in
+        # one worker thread hop rather than blocking the event loop per chunk
+        keys = [self._cache_key(text) for text in texts]
+        embeddings = await asyncio.to_thread(self._cache_get_many, keys)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            new_embeddings = await self._embed_texts([texts[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+            await asyncio.to_thread(
+                self._cache_set_many,
+                [(keys[i], embeddings[i]) for i in missing]
+            )
+
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def _cache_get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up cached embeddings, with ``None`` for misses."""
+        return [self.cache.get(key) for key in keys]
+
+    def _cache_set_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        """Store embeddings in the cache in a single transaction."""
+        with self.cache.transact():
+            for key, embedding in items:
+                self.cache.set(key, embedding)
+
+    async def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Generate embeddings for a list of text chunks using OpenAI.
+
+        Texts are sent in batches of up to ``embedding_batch_size`` inputs per
+        request, with at most ``embedding_concurrency`` requests in flight
+        across the whole processor.
+        """
+        async def embed_batch(batch: List[str]) -> np.ndarray:
+            async with self._embedding_semaphore:
+                try:
+                    response = await self._create_embeddings(batch)
+                except Exception:
+                    logger.error("Error generating embedding", exc_info=True)
+                    raise
+            return np.asarray(
+                [item.embedding for item in sorted(response.data, key=lambda item: item.index)],
+                dtype=np.float32
+            )
+
+        tasks = [
+            asyncio.create_task(embed_batch(texts[start:start + self.embedding_batch_size]))
+            for start in range(0, len(texts), self.embedding_batch_size)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            await self._cancel_tasks(tasks)
+            raise
+        
+        return np.concatenate(results)
+
+    @staticmethod
+    async def _cancel_tasks(tasks: List[asyncio.Task]) -> None:
+        """Cancel tasks left running after a failure and wait for them to stop.
+
+        Without this, sibling tasks of a failed ``gather`` would keep sending
+        requests after the error had been reported.
+        """
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _create_embeddings(self, batch: List[str]):
+        """Request embeddings for a batch, backing off on transient errors."""
+        return await self._request_with_retries(
+            self.client.embeddings.create,
+            model=EMBEDDING_MODEL,
+            input=batch
+        )
+
+    async def _request_with_retries(self, request: Callable[..., Awaitable[Any]], **kwargs):
+        """Call an OpenAI API method, backing off on transient errors."""
+        retrying = AsyncRetrying(
+            wait=EMBEDDING_RETRY_WAIT,
+            stop=stop_after_attempt(self.embedding_max_attempts),
+            retry=retry_if_exception_type((RateLimitError, InternalServerError, APIConnectionError)),
+            reraise=True
+        )
+        async for attempt in retrying:
+            with attempt:
+                return await request(**kwargs)
+
+    async def _embed_chunks(self, chunk_iter: Iterator[str]) -> Tuple[List[str], np.ndarray]:
+        """Embed chunks as they are produced.
+
+        Each full batch of chunks is dispatched for embedding as soon as it is
+        ready, so embedding requests are in flight while chunking continues.
+        """
+        batch_size = self.embedding_batch_size
+        chunks = []
+        tasks = []
+        try:
+            for chunk in chunk_iter:
+                chunks.append(chunk)
+                if len(chunks) % batch_size == 0:
+                    tasks.append(asyncio.create_task(self.generate_embeddings(chunks[-batch_size:])))
+                    # Let the request start before chunking the next batch
+                    await asyncio.sleep(0)
+            remainder = len(chunks) % batch_size
+            if remainder:
+                tasks.append(asyncio.create_task(self.generate_embeddings(chunks[-remainder:])))
             
-        return chunks
+            if not tasks:
+                return chunks, self._empty_embeddings()
+            return chunks, np.concatenate(await asyncio.gather(*tasks))
+        except BaseException:
+            await self._cancel_tasks(tasks)
+            raise
+
+    @staticmethod
+    async def _read_file(file_path: str) -> str:
+        """Read a text file from disk without blocking the event loop."""
+        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+            return await f.read()
 
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of text chunks using OpenAI."""
-        embeddings = []
+    @staticmethod
+    def _build_result(file_path: str,
+                      chunks: List[str],
+                      embeddings: np.ndarray) -> Dict[str, Any]:
+        """Attach per-chunk metadata to a processed file's chunks and embeddings."""
+        # Create metadata for each chunk, statting the file only once
+        last_updated = str(os.stat(file_path).st_mtime)
+        metadata = [
+            {"source": file_path, "chunk_index": i, "last_updated": last_updated}
+            for i in range(len(chunks))
+        ]
         
-        for text in texts:
-            try:
-                response = await self.client.embeddings.create(
-                    model="text-embedding-ada-002",
-                    input=text
-                )
-                embeddings.append(response.data[0].embedding)
-            except Exception as e:
-                print(f"Error generating embedding: {e}")
-                raise
-                
-        return embeddings
+        return {
+            "chunks": chunks,
+            "embeddings": embeddings,
+            "metadata": metadata
+        }
 
     async def process_markdown_file(self, file_path: str) -> Dict[str, Any]:
         """Process a markdown file and return chunks with their embeddings."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = await self._read_file(file_path)
             
-            # Generate chunks
-            chunks = self.chunk_document(content)
+            # Generate chunks and their embeddings
+            chunks, embeddings = await self._embed_chunks(self.iter_chunks(content))
             
-            # Generate embeddings
-            embeddings = await self.generate_embeddings(chunks)
+            return self._build_result(file_path, chunks, embeddings)
             
-            # Create metadata for each chunk
-            metadata = []
-            for i, chunk in enumerate(chunks):
-                metadata.append({
-                    "source": file_path,
-                    "chunk_index": i,
-                    "last_updated": str(Path(file_path).stat().st_mtime)
-                })
-            
-            return {
-                "chunks": chunks,
-                "embeddings": embeddings,
-                "metadata": metadata
+        except Exception:
+            logger.error("Error processing file %s", file_path, exc_info=True)
+            raise
+
+    @staticmethod
+    def _find_documents(directory_path: str) -> List[str]:
+        """List all markdown and text files under a directory."""
+        return [
+            os.path.join(root, file)
+            for root, _, files in os.walk(directory_path)
+            for file in files
+            if file.endswith(('.md', '.txt'))
+        ]
+
+    async def process_directory(self,
+                                directory_path: str,
+                                ingest_mode: str = "sync") -> List[Dict[str, Any]]:
+        """Process all markdown files in a directory.
+
+        With ``ingest_mode="batch"`` embeddings are generated through the
+        OpenAI Batch API instead (see ``process_directory_batch``).
+        """
+        if ingest_mode == "batch":
+            return await self.process_directory_batch(directory_path)
+        if ingest_mode != "sync":
+            raise ValueError(f"Unknown ingest mode: {ingest_mode}")
+
+        file_paths = self._find_documents(directory_path)
+        semaphore = asyncio.Semaphore(self.file_concurrency)
+
+        async def process_file(file_path: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.process_markdown_file(file_path)
+
+        tasks = [asyncio.create_task(process_file(path)) for path in file_paths]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            # Stop embedding the remaining files once one has failed
+            await self._cancel_tasks(tasks)
+            raise
+
+    async def process_directory_batch(self,
+                                      directory_path: str,
+                                      poll_interval: float = 60) -> List[Dict[str, Any]]:
+        """Process all markdown files in a directory using the OpenAI Batch API.
+
+        Batch jobs are billed at half the synchronous price but may take up to
+        24 hours to complete, so this waits until the jobs finish. Requests are
+        split across as many jobs as the per-batch limits require. Cached
+        chunks are not sent, and new embeddings are written to the cache.
+        """
+        documents = []
+        for file_path in self._find_documents(directory_path):
+            content = await self._read_file(file_path)
+            documents.append((file_path, self.chunk_document(content)))
+
+        texts_by_id = {
+            f"{file_path}:{i}": chunk
+            for file_path, chunks in documents
+            for i, chunk in enumerate(chunks)
+        }
+        # Only chunks missing from the cache are uploaded and billed
+        embeddings_by_id = {}
+        if self.cache is not None and texts_by_id:
+            cached = await asyncio.to_thread(
+                self._cache_get_many,
+                [self._cache_key(text) for text in texts_by_id.values()]
+            )
+            embeddings_by_id = {
+                custom_id: embedding
+                for custom_id, embedding in zip(texts_by_id, cached)
+                if embedding is not None
             }
+        requests = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {"model": EMBEDDING_MODEL, "input": text}
+            })
+            for custom_id, text in texts_by_id.items()
+            if custom_id not in embeddings_by_id
+        ]
+
+        try:
+            if requests:
+                tasks = [
+                    asyncio.create_task(self._run_embedding_batch(shard, poll_interval))
+                    for shard in self._shard_batch_requests(requests)
+                ]
+                try:
+                    results = await asyncio.gather(*tasks)
+                except BaseException:
+                    await self._cancel_tasks(tasks)
+                    raise
+                
+                new_embeddings = {}
+                for result in results:
+                    new_embeddings.update(result)
+                embeddings_by_id.update(new_embeddings)
+                if self.cache is not None:
+                    await asyncio.to_thread(self._cache_set_many, [
+                        (self._cache_key(texts_by_id[custom_id]), np.asarray(embedding, dtype=np.float32))
+                        for custom_id, embedding in new_embeddings.items()
+                    ])
             
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
+            return [
+                self._build_result(
+                    file_path,
+                    chunks,
+                    np.asarray(
+                        [embeddings_by_id[f"{file_path}:{i}"] for i in range(len(chunks))],
+                        dtype=np.float32
+                    ) if chunks else self._empty_embeddings()
+                )
+                for file_path, chunks in documents
+            ]
+        except Exception:
+            logger.error("Error processing directory %s with batch API", directory_path, exc_info=True)
             raise
 
-    async def process_directory(self, directory_path: str) -> List[Dict[str, Any]]:
-        """Process all markdown files in a directory."""
-        results = []
-        
-        for root, _, files in os.walk(directory_path):
-            for file in files:
-                if file.endswith(('.md', '.txt')):
-                    file_path = os.path.join(root, file)
-                    result = await self.process_markdown_file(file_path)
-                    results.append(result)
-        
-        return results
\ No newline at end of file
+    @staticmethod
+    def _shard_batch_requests(requests: List[str]) -> List[List[str]]:
+        """Split Batch API input lines into shards within the per-batch limits."""
+        shards = [[]]
+        shard_bytes = 0
+        for request in requests:
+            request_bytes = len(request.encode("utf-8")) + 1
+            if shards[-1] and (len(shards[-1]) >= BATCH_MAX_REQUESTS
+                               or shard_bytes + request_bytes > BATCH_MAX_FILE_BYTES):
+                shards.append([])
+                shard_bytes = 0
+            shards[-1].append(request)
+            shard_bytes += request_bytes
+        return shards
+
+    async def _run_embedding_batch(self,
+                                   requests: List[str],
+                                   poll_interval: float) -> Dict[str, List[float]]:
+        """Run one Batch API job and return its embeddings keyed by custom id.
+
+        Raises ``RuntimeError`` unless every request in the job succeeded.
+        """
+        input_file = await self._request_with_retries(
+            self.client.files.create,
+            file=("embeddings.jsonl", "\n".join(requests).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await self._request_with_retries(
+            self.client.batches.create,
+            input_file_id=input_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h"
+        )
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            await asyncio.sleep(poll_interval)
+            batch = await self._request_with_retries(self.client.batches.retrieve, batch_id=batch.id)
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Embedding batch {batch.id} ended with status {batch.status}")
+
+        # Failed requests are written to a separate error file, not the output
+        if batch.error_file_id:
+            errors = await self._request_with_retries(self.client.files.content, file_id=batch.error_file_id)
+            failures = [json.loads(line) for line in errors.text.splitlines() if line.strip()]
+            if failures:
+                first = failures[0]
+                raise RuntimeError(
+                    f"{len(failures)} embedding requests in batch {batch.id} failed, "
+                    f"first {first['custom_id']}: {first.get('error') or first.get('response')}"
+                )
+        if not batch.output_file_id:
+            raise RuntimeError(f"Embedding batch {batch.id} produced no output")
+
+        output = await self._request_with_retries(self.client.files.content, file_id=batch.output_file_id)
+        embeddings_by_id = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            embeddings_by_id[record["custom_id"]] = record["response"]["body"]["data"][0]["embedding"]
+
+        if len(embeddings_by_id) != len(requests):
+            raise RuntimeError(
+                f"Embedding batch {batch.id} returned {len(embeddings_by_id)} "
+                f"of {len(requests)} embeddings"
+            )
+        return embeddings_by_id
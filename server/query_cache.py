@@ -0,0 +1,102 @@
+from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict
+import hashlib
+import time
+import numpy as np
+
+class QueryCache:
+    def __init__(self,
+                 max_size: int = 10_000,
+                 ttl: float = 3600,
+                 similarity_threshold: float = 0.97,
+                 max_semantic_entries: int = 256):
+        """Initialize a two-tier cache for query embeddings and search results.
+
+        The exact tier maps normalized query text to its embedding. The semantic
+        tier keeps recent search results and reuses them for any query whose
+        embedding has cosine similarity above ``similarity_threshold``.
+        Each ``clear_results`` starts a new generation, so searches that ran
+        against the store before a write cannot repopulate the semantic tier.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.max_semantic_entries = max_semantic_entries
+        self._embeddings: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._results: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.generation = 0
+
+    @staticmethod
+    def _key(query: str) -> str:
+        """Cache key for a query, ignoring case and surrounding whitespace."""
+        return hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return time.monotonic() - created > self.ttl
+
+    def get_embedding(self, query: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a query, if any."""
+        key = self._key(query)
+        entry = self._embeddings.get(key)
+        if entry is None:
+            return None
+        created, embedding = entry
+        if self._expired(created):
+            del self._embeddings[key]
+            return None
+        self._embeddings.move_to_end(key)
+        return embedding
+
+    def put_embedding(self, query: str, embedding: np.ndarray) -> None:
+        """Cache the embedding for a query, evicting the least recently used."""
+        key = self._key(query)
+        self._embeddings[key] = (time.monotonic(), embedding)
+        self._embeddings.move_to_end(key)
+        while len(self._embeddings) > self.max_size:
+            self._embeddings.popitem(last=False)
+
+    def get_results(self, embedding: np.ndarray, n_results: int) -> Optional[Dict[str, Any]]:
+        """Return cached search results for a semantically equivalent query."""
+        if self._vectors is None:
+            return None
+        similarities = self._vectors @ self._normalize(embedding)
+        for i in np.argsort(similarities)[::-1]:
+            if similarities[i] < self.similarity_threshold:
+                break
+            created, cached_n_results, results = self._results[i]
+            if cached_n_results == n_results and not self._expired(created):
+                return results
+        return None
+
+    def put_results(self,
+                    embedding: np.ndarray,
+                    n_results: int,
+                    results: Dict[str, Any],
+                    generation: Optional[int] = None) -> None:
+        """Cache search results for a query embedding, evicting the oldest.
+
+        ``generation`` is the value of ``self.generation`` captured before the
+        search; results are dropped if the cache was cleared since then.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        vector = self._normalize(embedding)[np.newaxis, :]
+        if self._vectors is None:
+            self._vectors = vector
+        else:
+            self._vectors = np.vstack([self._vectors, vector])[-self.max_semantic_entries:]
+        self._results.append((time.monotonic(), n_results, results))
+        self._results = self._results[-self.max_semantic_entries:]
+
+    def clear_results(self) -> None:
+        """Drop cached search results, e.g. after the vector store changes."""
+        self.generation += 1
+        self._vectors = None
+        self._results = []
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -1,14 +1,40 @@
 from typing import List, Dict, Any, Optional
+import asyncio
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of chunks written to the collection in a single add call
+ADD_BATCH_SIZE = 1000
 
 class VectorStore:
-    def __init__(self, persist_directory: str = "./chroma_db"):
-        """Initialize ChromaDB with persistence."""
+    def __init__(self,
+                 persist_directory: str = "./chroma_db",
+                 collection_name: str = "documents",
+                 hnsw_m: int = 24,
+                 hnsw_ef_construction: int = 128,
+                 hnsw_ef_search: int = 100,
+                 allow_reset: bool = False):
+        """Initialize ChromaDB with persistence and telemetry disabled.
+
+        The HNSW parameters only apply when the collection is first created.
+        ``allow_reset`` enables ``client.reset()``, which wipes the database.
+        """
         self.persist_directory = persist_directory
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self._get_or_create_collection()
+        self.hnsw_params = {
+            "hnsw:M": hnsw_m,
+            "hnsw:construction_ef": hnsw_ef_construction,
+            "hnsw:search_ef": hnsw_ef_search
+        }
+        self.client = chromadb.PersistentClient(
+            path=persist_directory,
+            settings=Settings(anonymized_telemetry=False, allow_reset=allow_reset)
+        )
+        self.collection = self._get_or_create_collection(collection_name)
 
     def _get_or_create_collection(self, name: str = "documents"):
         """Get existing collection or create a new one."""
@@ -17,35 +43,47 @@ class VectorStore:
         except ValueError:
             return self.client.create_collection(
                 name=name,
-                metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+                metadata={"hnsw:space": "cosine", **self.hnsw_params}  # Use cosine similarity
             )
 
     def add_documents(self,
                       chunks: List[str],
-                      embeddings: List[List[float]],
-                      metadata: List[Dict[str, Any]]) -> None:
-        """Add document chunks and their embeddings to the vector store."""
+                      embeddings: np.ndarray,
+                      metadata: List[Dict[str, Any]],
+                      ids: Optional[List[str]] = None) -> None:
+        """Add document chunks and their embeddings to the vector store.
+
+        Chunk ids default to ``{source}_{chunk_index}``; callers that already
+        hold them can pass ``ids`` to skip rebuilding them.
+        Large inputs are written in slices of ``ADD_BATCH_SIZE`` to bound memory.
+        Embeddings are kept as a contiguous float32 array and only converted to
+        the nested lists Chroma's client API requires one slice at a time.
+        """
         try:
-            ids = [f"{meta['source']}_{meta['chunk_index']}" for meta in metadata]
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                documents=chunks,
-                metadatas=metadata
-            )
-            print(f"Successfully added {len(chunks)} documents to the collection.")
-        except Exception as e:
-            print(f"Error adding documents: {e}")
+            if ids is None:
+                ids = [f"{meta['source']}_{meta['chunk_index']}" for meta in metadata]
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            for start in range(0, len(ids), ADD_BATCH_SIZE):
+                end = start + ADD_BATCH_SIZE
+                self.collection.add(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end].tolist(),
+                    documents=chunks[start:end],
+                    metadatas=metadata[start:end]
+                )
+            logger.info("Successfully added %s documents to the collection.", len(chunks))
+        except Exception:
+            logger.error("Error adding documents", exc_info=True)
             raise
 
     def search_similar(self, 
-                      query_embedding: List[float],
+                      query_embedding: np.ndarray,
                       n_results: int = 3,
                       metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Search for similar documents using query embedding."""
         try:
             results = self.collection.query(
-                query_embeddings=[query_embedding],
+                query_embeddings=[np.asarray(query_embedding, dtype=np.float32).tolist()],
                 n_results=n_results,
                 where=metadata_filter
             )
@@ -55,33 +93,53 @@ class VectorStore:
                 "metadatas": results["metadatas"][0],
                 "distances": results["distances"][0]
             }
-        except Exception as e:
-            print(f"Error searching ChromaDB: {e}")
+        except Exception:
+            logger.error("Error searching ChromaDB", exc_info=True)
             raise
 
     def update_document(self,
                        document_id: str,
                        chunk: str,
-                       embedding: List[float],
+                       embedding: np.ndarray,
                        metadata: Dict[str, Any]) -> None:
         """Update an existing document in the vector store."""
         try:
             self.collection.update(
                 ids=[document_id],
-                embeddings=[embedding],
+                embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],
                 documents=[chunk],
                 metadatas=[metadata]
             )
-        except Exception as e:
-            print(f"Error updating document in ChromaDB: {e}")
+        except Exception:
+            logger.error("Error updating document in ChromaDB", exc_info=True)
             raise
 
     def delete_document(self, document_id: str) -> None:
         """Delete a document from the vector store."""
         try:
             self.collection.delete(ids=[document_id])
-        except Exception as e:
-            print(f"Error deleting document from ChromaDB: {e}")
+        except Exception:
+            logger.error("Error deleting document from ChromaDB", exc_info=True)
+            raise
+
+    def delete_by_source(self, source: str) -> int:
+        """Delete all chunks from a source document and return how many were removed."""
+        try:
+            where = {"source": source}
+            count = len(self.collection.get(where=where, include=[])["ids"])
+            if count:
+                self.collection.delete(where=where)
+            return count
+        except Exception:
+            logger.error("Error deleting source %s from ChromaDB", source, exc_info=True)
+            raise
+
+    def exists(self, document_id: str) -> bool:
+        """Check whether a document is in the vector store without loading it."""
+        try:
+            return bool(self.collection.get(ids=[document_id], include=[])["ids"])
+        except Exception:
+            logger.error("Error checking document in ChromaDB", exc_info=True)
             raise
 
     def get_document_by_id(self, document_id: str) -> Dict[str, Any]:
@@ -92,19 +150,47 @@ class VectorStore:
                 "document": result["documents"][0],
                 "metadata": result["metadatas"][0]
             }
-        except Exception as e:
-            print(f"Error retrieving document from ChromaDB: {e}")
+        except Exception:
+            logger.error("Error retrieving document from ChromaDB", exc_info=True)
+            raise
+
+    def list_chunks(self, include_content: bool = False) -> Dict[str, Any]:
+        """List the metadata of every chunk, and its content if requested.
+
+        Returns ``metadatas`` and, with ``include_content``, ``documents`` in
+        the same order.
+        """
+        try:
+            include = ["metadatas", "documents"] if include_content else ["metadatas"]
+            results = self.collection.get(include=include)
+            chunks = {"metadatas": results["metadatas"]}
+            if include_content:
+                chunks["documents"] = results["documents"]
+            return chunks
+        except Exception:
+            logger.error("Error listing chunks from ChromaDB", exc_info=True)
+            raise
+
+    def count(self) -> int:
+        """Number of chunks in the collection."""
+        try:
+            return self.collection.count()
+        except Exception:
+            logger.error("Error counting chunks in ChromaDB", exc_info=True)
             raise
 
     def clear_collection(self) -> None:
-        """Clear all documents from the collection."""
+        """Clear all documents from the collection.
+
+        Chunks are deleted by id so the collection and its index are kept.
+        """
         try:
-            all_ids = self.collection.get()["ids"]
+            all_ids = self.collection.get(include=[])["ids"]
             if all_ids:
                 self.collection.delete(ids=all_ids)
-            print("Cleared all documents from the collection.")
-        except Exception as e:
-            print(f"Error clearing ChromaDB collection: {e}")
+            logger.info("Cleared all documents from the collection.")
+        except Exception:
+            logger.error("Error clearing ChromaDB collection", exc_info=True)
             raise
 
     def list_collections_and_embeddings(self) -> Dict[str, Dict[str, Any]]:
@@ -120,27 +206,74 @@ class VectorStore:
             if "embeddings" in collection_data and collection_data["embeddings"] is not None:
                 result["documents"]["embeddings"] = collection_data["embeddings"]
             else:
-                print("Warning: Embeddings are not available in the collection data.")
+                logger.warning("Embeddings are not available in the collection data.")
             return result
-        except Exception as e:
-            print(f"Error listing collections and embeddings: {e}")
+        except Exception:
+            logger.error("Error listing collections and embeddings", exc_info=True)
             raise
 
     def list_collections(self) -> List[str]:
         """List all collections in the vector store."""
         try:
             return self.client.list_collections()
-        except Exception as e:
-            print(f"Error listing collections: {e}")
+        except Exception:
+            logger.error("Error listing collections", exc_info=True)
             raise
 
     def clear_all_embeddings(self) -> None:
         """Clear all embeddings from all collections in the vector store."""
         try:
-            all_ids = self.collection.get()["ids"]
+            all_ids = self.collection.get(include=[])["ids"]
             if all_ids:
                 self.collection.delete(ids=all_ids)
-            print("Cleared all embeddings from the collection.")
-        except Exception as e:
-            print(f"Error clearing all embeddings: {e}")
-            raise
\ No newline at end of file
+            logger.info("Cleared all embeddings from the collection.")
+        except Exception:
+            logger.error("Error clearing all embeddings", exc_info=True)
+            raise
+
+    # Async wrappers. Chroma calls are synchronous and CPU-bound (HNSW
+    # updates, serialization), so they run in a worker thread to keep the
+    # event loop free for other requests.
+
+    async def aadd_documents(self,
+                             chunks: List[str],
+                             embeddings: np.ndarray,
+                             metadata: List[Dict[str, Any]],
+                             ids: Optional[List[str]] = None) -> None:
+        """Async version of ``add_documents``."""
+        await asyncio.to_thread(self.add_documents, chunks, embeddings, metadata, ids)
+
+    async def asearch_similar(self,
+                              query_embedding: np.ndarray,
+                              n_results: int = 3,
+                              metadata_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Async version of ``search_similar``."""
+        return await asyncio.to_thread(self.search_similar, query_embedding, n_results, metadata_filter)
+
+    async def adelete_by_source(self, source: str) -> int:
+        """Async version of ``delete_by_source``."""
+        return await asyncio.to_thread(self.delete_by_source, source)
+
+    async def alist_chunks(self, include_content: bool = False) -> Dict[str, Any]:
+        """Async version of ``list_chunks``."""
+        return await asyncio.to_thread(self.list_chunks, include_content)
+
+    async def acount(self) -> int:
+        """Async version of ``count``."""
+        return await asyncio.to_thread(self.count)
+
+    async def aclear_collection(self) -> None:
+        """Async version of ``clear_collection``."""
+        await asyncio.to_thread(self.clear_collection)
+
+    async def alist_collections_and_embeddings(self) -> Dict[str, Dict[str, Any]]:
+        """Async version of ``list_collections_and_embeddings``."""
+        return await asyncio.to_thread(self.list_collections_and_embeddings)
+
+    async def alist_collections(self) -> List[str]:
+        """Async version of ``list_collections``."""
+        return await asyncio.to_thread(self.list_collections)
+
+    async def aclear_all_embeddings(self) -> None:
+        """Async version of ``clear_all_embeddings``."""
+        await asyncio.to_thread(self.clear_all_embeddings)
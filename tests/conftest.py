@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+from tenacity import wait_none
+
+# Keep ChromaDB's SQLite and HNSW files in RAM during tests on Linux. Set
+# before pytest creates its temporary directories; an explicit TMPDIR wins.
+if sys.platform.startswith("linux") and os.path.isdir("/dev/shm"):
+    os.environ.setdefault("TMPDIR", "/dev/shm")
+
+@pytest.fixture(scope="module")
+def temp_db_dir(tmp_path_factory, request):
+    """Create a temporary directory for ChromaDB storage, unique per xdist worker."""
+    # Read the worker id from the config so the suite also runs without xdist
+    workerinput = getattr(request.config, "workerinput", None)
+    worker_id = workerinput["workerid"] if workerinput else "master"
+    return str(tmp_path_factory.mktemp(f"chroma_{worker_id}"))
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    """Retry failed OpenAI requests without backoff, so offline tests fail fast."""
+    monkeypatch.setattr("server.document_processor.EMBEDDING_RETRY_WAIT", wait_none())
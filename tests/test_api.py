@@ -1,35 +1,58 @@
 import pytest
 from fastapi.testclient import TestClient
-import tempfile
+import atexit
 import os
 import shutil
+import tempfile
 from pathlib import Path
+from unittest.mock import AsyncMock
+import numpy as np
 
-from server.api import app, Settings
+# Importing server.api creates its default vector store and embedding cache,
+# so point them at a scratch directory instead of the working directory
+_import_dir = tempfile.mkdtemp(prefix="mcp_api_")
+atexit.register(shutil.rmtree, _import_dir, ignore_errors=True)
+os.environ.setdefault("CHROMA_DB_DIR", os.path.join(_import_dir, "chroma_db"))
+os.environ.setdefault("EMBEDDING_CACHE_DIR", os.path.join(_import_dir, "embedding_cache"))
+
+from server.api import app, Settings, get_vector_store, get_document_processor, get_query_cache
 from server.document_processor import DocumentProcessor
 from server.vector_store import VectorStore
+from server.query_cache import QueryCache
 
 @pytest.fixture
-def test_settings():
-    """Create test settings."""
+def test_settings(tmp_path):
+    """Create test settings backed by pytest-managed temporary directories."""
     return Settings(
         openai_api_key="test-key",
-        documents_dir=tempfile.mkdtemp(),
-        chroma_db_dir=tempfile.mkdtemp()
+        documents_dir=str(tmp_path / "documents"),
+        chroma_db_dir=str(tmp_path / "chroma_db"),
+        embedding_cache_dir=str(tmp_path / "embedding_cache")
     )
 
 @pytest.fixture
-def test_client(test_settings):
-    """Create test client with temporary directories."""
-    # Override settings in app
-    app.dependency_overrides[Settings] = lambda: test_settings
-    
-    client = TestClient(app)
-    yield client
-    
-    # Cleanup temporary directories
-    shutil.rmtree(test_settings.documents_dir)
-    shutil.rmtree(test_settings.chroma_db_dir)
+def test_store(test_settings):
+    """Vector store in the test's temporary directory."""
+    return VectorStore(test_settings.chroma_db_dir)
+
+@pytest.fixture
+def test_processor(test_settings):
+    """Document processor that caches in the test's temporary directory."""
+    # Fail fast on unreachable OpenAI calls instead of retrying them
+    return DocumentProcessor(
+        test_settings.openai_api_key,
+        cache_dir=test_settings.embedding_cache_dir,
+        embedding_max_attempts=1
+    )
+
+@pytest.fixture
+def test_client(test_store, test_processor):
+    """Create test client whose services live in temporary directories."""
+    app.dependency_overrides[get_vector_store] = lambda: test_store
+    app.dependency_overrides[get_document_processor] = lambda: test_processor
+    app.dependency_overrides[get_query_cache] = lambda: QueryCache()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
 
 @pytest.fixture
 def sample_markdown_file(test_settings):
@@ -71,6 +94,27 @@ def test_process_documents(test_client, sample_markdown_file):
     assert response.status_code == 500
     assert "error" in response.json()["detail"].lower()
 
+def test_process_documents_batch_job(test_client, test_store, test_processor, sample_markdown_file):
+    """Test that batch ingest runs as a background job with a status endpoint."""
+    test_processor.process_directory = AsyncMock(return_value=[{
+        "chunks": ["First chunk."],
+        "embeddings": np.full((1, 1536), 0.1, dtype=np.float32),
+        "metadata": [{"source": sample_markdown_file, "chunk_index": 0, "last_updated": "123456"}]
+    }])
+    
+    response = test_client.post("/documents/process", json={
+        "directory": os.path.dirname(sample_markdown_file),
+        "ingest_mode": "batch"
+    })
+    job = test_client.get(f"/documents/jobs/{response.json()['job_id']}")
+    
+    assert response.status_code == 202
+    assert job.json()["status"] == "completed"
+    assert job.json()["processed_files"] == 1
+    assert test_processor.process_directory.await_args.kwargs["ingest_mode"] == "batch"
+    assert test_store.count() == 1
+    assert test_client.get("/documents/jobs/unknown").status_code == 404
+
 def test_generate_context_no_documents(test_client):
     """Test generating context with no documents."""
     response = test_client.post("/context/generate", json={
@@ -80,6 +124,29 @@ def test_generate_context_no_documents(test_client):
     # Should fail because no documents are processed
     assert response.status_code == 500
 
+def test_generate_context(test_client, test_store, test_processor):
+    """Test generating context with a stubbed query embedding."""
+    test_store.add_documents(
+        chunks=["First chunk.", "Second chunk."],
+        embeddings=[[1.0, 0.0], [0.0, 1.0]],
+        metadata=[
+            {"source": "test.md", "chunk_index": 0, "last_updated": "123456"},
+            {"source": "test.md", "chunk_index": 1, "last_updated": "123456"}
+        ]
+    )
+    test_processor.generate_embeddings = AsyncMock(return_value=np.array([[1.0, 0.0]], dtype=np.float32))
+    
+    response = test_client.post("/context/generate", json={
+        "query": "first",
+        "n_results": 2
+    })
+    
+    assert response.status_code == 200
+    contexts = response.json()["contexts"]
+    assert [c["content"] for c in contexts] == ["First chunk.", "Second chunk."]
+    assert contexts[0]["relevance_score"] == pytest.approx(1.0, abs=1e-6)
+    assert contexts[1]["relevance_score"] == pytest.approx(0.0, abs=1e-6)
+
 def test_list_documents_empty(test_client):
     """Test listing documents when none are processed."""
     response = test_client.get("/documents/list")
@@ -87,6 +154,25 @@ def test_list_documents_empty(test_client):
     assert "documents" in response.json()
     assert len(response.json()["documents"]) == 0
 
+def test_list_documents_content(test_client, test_store):
+    """Test listing documents with and without chunk content."""
+    test_store.add_documents(
+        chunks=["Second chunk.", "First chunk."],
+        embeddings=np.repeat(np.array([0.2, 0.1], dtype=np.float32)[:, None], 1536, axis=1),
+        metadata=[
+            {"source": "test.md", "chunk_index": 1, "last_updated": "123456"},
+            {"source": "test.md", "chunk_index": 0, "last_updated": "123456"}
+        ]
+    )
+    
+    listing = test_client.get("/documents/list").json()["documents"]
+    with_content = test_client.get(
+        "/documents/list", params={"include_content": True}
+    ).json()["documents"]
+    
+    assert listing["test.md"]["chunks"] == [{"chunk_index": 0}, {"chunk_index": 1}]
+    assert [c["content"] for c in with_content["test.md"]["chunks"]] == ["First chunk.", "Second chunk."]
+
 def test_delete_nonexistent_document(test_client):
     """Test deleting a document that doesn't exist."""
     response = test_client.delete("/documents/nonexistent.md")
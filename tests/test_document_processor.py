@@ -1,8 +1,19 @@
 import pytest
 import os
+import asyncio
+import json
+import numpy as np
 from pathlib import Path
 import tempfile
-from server.document_processor import DocumentProcessor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import httpx
+from openai import APIConnectionError, InternalServerError
+from server.document_processor import (
+    DocumentProcessor,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_REQUEST_TOKENS
+)
 
 @pytest.fixture
 def sample_markdown_content():
@@ -29,8 +40,8 @@ def temp_markdown_file(sample_markdown_content):
 
 @pytest.fixture
 def document_processor():
-    # Use a mock API key for testing
-    return DocumentProcessor("test-api-key")
+    # Use a mock API key for testing, failing fast on unreachable API calls
+    return DocumentProcessor("test-api-key", embedding_max_attempts=1)
 
 def test_chunk_document(document_processor, sample_markdown_content):
     """Test document chunking functionality."""
@@ -43,18 +54,98 @@ def test_chunk_document(document_processor, sample_markdown_content):
     combined = ''.join(chunks)
     assert all(section in combined for section in ["Section 1", "Section 2", "Subsection 2.1"])
 
+def fake_embeddings_response(inputs):
+    """Build an embeddings response with items deliberately out of order."""
+    data = [
+        SimpleNamespace(index=i, embedding=[float(len(text))])
+        for i, text in enumerate(inputs)
+    ]
+    return SimpleNamespace(data=list(reversed(data)))
+
 @pytest.mark.asyncio
 async def test_generate_embeddings(document_processor):
-    """Test embedding generation."""
-    texts = ["This is a test sentence.", "Another test sentence."]
+    """Test embedding generation is batched and preserves input order."""
+    texts = ["x" * (i + 1) for i in range(EMBEDDING_BATCH_SIZE + 5)]
+    create = AsyncMock(side_effect=lambda model, input: fake_embeddings_response(input))
+    document_processor.client.embeddings.create = create
     
-    try:
-        embeddings = await document_processor.generate_embeddings(texts)
-        # This will fail with mock API key, but we can check the function structure
-        assert False, "Should raise an error with mock API key"
-    except Exception as e:
-        # Expect an error due to invalid API key
-        assert "Error generating embedding" in str(e)
+    embeddings = await document_processor.generate_embeddings(texts)
+    
+    assert create.await_count == 2
+    assert len(create.await_args_list[0].kwargs["input"]) == EMBEDDING_BATCH_SIZE
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.dtype == np.float32
+    assert embeddings.tolist() == [[float(len(text))] for text in texts]
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_concurrency_limit():
+    """Test that concurrent batch requests are bounded across calls."""
+    processor = DocumentProcessor("test-api-key", embedding_concurrency=2)
+    in_flight = 0
+    peak = 0
+
+    async def create(model, input):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return fake_embeddings_response(input)
+
+    processor.client.embeddings.create = create
+    texts = ["text"] * (EMBEDDING_BATCH_SIZE * 5)
+    
+    results = await asyncio.gather(
+        processor.generate_embeddings(texts),
+        processor.generate_embeddings(texts)
+    )
+
+    assert [len(embeddings) for embeddings in results] == [len(texts), len(texts)]
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_cache(tmp_path):
+    """Test that cached chunks are not re-embedded."""
+    processor = DocumentProcessor("test-api-key", cache_dir=str(tmp_path / "cache"))
+    create = AsyncMock(side_effect=lambda model, input: fake_embeddings_response(input))
+    processor.client.embeddings.create = create
+    
+    first = await processor.generate_embeddings(["a", "bb"])
+    second = await processor.generate_embeddings(["ccc", "a", "bb"])
+    
+    assert first.tolist() == [[1.0], [2.0]]
+    assert second.tolist() == [[3.0], [1.0], [2.0]]
+    assert create.await_args_list[1].kwargs["input"] == ["ccc"]
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_error(document_processor):
+    """Test embedding errors are propagated."""
+    document_processor.client.embeddings.create = AsyncMock(side_effect=RuntimeError("boom"))
+    
+    with pytest.raises(RuntimeError):
+        await document_processor.generate_embeddings(["This is a test sentence."])
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_retries():
+    """Test that transient errors are retried and other errors are not."""
+    document_processor = DocumentProcessor("test-api-key")
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    create = AsyncMock(side_effect=[
+        APIConnectionError(request=request),
+        InternalServerError("server error", response=httpx.Response(500, request=request), body=None),
+        fake_embeddings_response(["a"])
+    ])
+    document_processor.client.embeddings.create = create
+    
+    embeddings = await document_processor.generate_embeddings(["a"])
+    
+    assert embeddings.tolist() == [[1.0]]
+    assert create.await_count == 3
+    
+    document_processor.client.embeddings.create = AsyncMock(side_effect=RuntimeError("boom"))
+    with pytest.raises(RuntimeError):
+        await document_processor.generate_embeddings(["a"])
+    assert document_processor.client.embeddings.create.await_count == 1
 
 @pytest.mark.asyncio
 async def test_process_markdown_file(document_processor, temp_markdown_file):
@@ -67,6 +158,24 @@ async def test_process_markdown_file(document_processor, temp_markdown_file):
         # Verify file was read before API error
         assert os.path.exists(temp_markdown_file)
 
+@pytest.mark.asyncio
+async def test_process_markdown_file_batches(document_processor, tmp_path):
+    """Test that a large file is embedded in batches dispatched while chunking."""
+    document_processor.chunk_size = 50
+    document_processor.chunk_overlap = 5
+    file_path = tmp_path / "large.md"
+    file_path.write_text("A short sentence here.\n" * 1000)
+    create = AsyncMock(side_effect=lambda model, input: fake_embeddings_response(input))
+    document_processor.client.embeddings.create = create
+    
+    result = await document_processor.process_markdown_file(str(file_path))
+    
+    chunks = result["chunks"]
+    assert len(chunks) > EMBEDDING_BATCH_SIZE
+    assert create.await_count == -(-len(chunks) // EMBEDDING_BATCH_SIZE)
+    assert result["embeddings"].tolist() == [[float(len(chunk))] for chunk in chunks]
+    assert len(result["metadata"]) == len(chunks)
+
 def test_chunk_document_overlap(document_processor):
     """Test that chunks properly overlap."""
     content = "." * (document_processor.chunk_size + 500)  # Content larger than chunk size
@@ -77,6 +186,55 @@ def test_chunk_document_overlap(document_processor):
     overlap = len(chunks[0]) + len(chunks[1]) - len(content[:len(chunks[0]) + len(chunks[1])])
     assert overlap >= document_processor.chunk_overlap - 1  # Allow for off-by-one due to splitting
 
+def test_chunk_document_split_points(document_processor):
+    """Test chunks split on the last period or newline within the chunk size."""
+    content = ("Ünïcode sentence one. Another line\n" * 100).strip()
+    chunks = document_processor.chunk_document(content)
+    
+    assert len(chunks) > 1
+    assert content.startswith(chunks[0])
+    assert chunks[0].endswith(" one") or chunks[0].endswith(" line")
+    assert len(chunks[0]) <= document_processor.chunk_size
+    assert chunks[-1] == content[len(content) - len(chunks[-1]):]
+
+def test_chunk_document_early_break(document_processor):
+    """Test chunking advances when the only break is within the overlap of the start."""
+    content = "a" * 149 + "." + "b" * 2000
+    chunks = document_processor.chunk_document(content)
+
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 550]
+    assert chunks[-1] == content[-550:]
+
+class CharacterEncoding:
+    """Offline stand-in for a tiktoken encoding with one token per character."""
+
+    def encode(self, text):
+        return [ord(char) for char in text]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+def test_chunk_document_by_tokens():
+    """Test chunking by token count with token overlap."""
+    processor = DocumentProcessor("test-api-key", chunk_size_tokens=10, chunk_overlap_tokens=2)
+    processor._encoding = CharacterEncoding()
+    
+    chunks = processor.chunk_document("abcdefghijklmnopqrstuvwxyz")
+    
+    assert chunks == ["abcdefghij", "ijklmnopqr", "qrstuvwxyz"]
+    assert processor.chunk_document("") == []
+
+def test_chunk_size_tokens_validation():
+    """Test that token chunk settings are checked against each other and the model limit."""
+    with pytest.raises(ValueError):
+        DocumentProcessor("test-api-key", chunk_size_tokens=100)
+    with pytest.raises(ValueError):
+        DocumentProcessor("test-api-key", chunk_size_tokens=10000)
+    
+    processor = DocumentProcessor("test-api-key", chunk_size_tokens=8000)
+    assert processor.embedding_batch_size * 8000 <= EMBEDDING_MAX_REQUEST_TOKENS
+    assert DocumentProcessor("test-api-key").embedding_batch_size == EMBEDDING_BATCH_SIZE
+
 @pytest.mark.asyncio
 async def test_process_directory(document_processor, temp_markdown_file):
     """Test processing a directory of markdown files."""
@@ -99,4 +257,189 @@ def test_chunk_document_small(document_processor):
     small_content = "Small test document."
     chunks = document_processor.chunk_document(small_content)
     assert len(chunks) == 1
-    assert chunks[0] == small_content
\ No newline at end of file
+    assert chunks[0] == small_content
+
+def test_chunk_document_exact_chunk_size(document_processor):
+    """Test a document exactly one chunk long is returned whole."""
+    content = "x" * document_processor.chunk_size
+    assert document_processor.chunk_document(content) == [content]
+
+@pytest.mark.asyncio
+async def test_process_directory_multiple_files(document_processor, tmp_path):
+    """Test that every markdown file in a directory tree is processed."""
+    (tmp_path / "nested").mkdir()
+    for name in ["a.md", "b.txt", "nested/c.md", "ignored.py"]:
+        (tmp_path / name).write_text(f"Content of {name}.")
+    document_processor.client.embeddings.create = AsyncMock(
+        side_effect=lambda model, input: fake_embeddings_response(input)
+    )
+    
+    results = await document_processor.process_directory(str(tmp_path))
+    
+    sources = sorted(result["metadata"][0]["source"] for result in results)
+    assert sources == sorted(str(tmp_path / name) for name in ["a.md", "b.txt", "nested/c.md"])
+
+@pytest.mark.asyncio
+async def test_process_directory_failure_cancels_files(document_processor, tmp_path):
+    """Test that a failing file stops the embedding of the other files."""
+    (tmp_path / "bad.md").write_text("bad")
+    (tmp_path / "slow.md").write_text("slow")
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def create(model, input):
+        if input == ["bad"]:
+            # Fail only once the other file's request is in flight
+            await started.wait()
+            raise RuntimeError("boom")
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    document_processor.client.embeddings.create = create
+    
+    with pytest.raises(RuntimeError):
+        await document_processor.process_directory(str(tmp_path))
+    assert cancelled.is_set()
+
+class FakeBatchAPI:
+    """In-memory stand-in for the OpenAI files and batches endpoints."""
+
+    def __init__(self, client, failing_ids=()):
+        self.files = {}
+        self.batches = []
+        self.failing_ids = set(failing_ids)
+        client.files.create = self.create_file
+        client.files.content = self.file_content
+        client.batches.create = self.create_batch
+        client.batches.retrieve = self.retrieve_batch
+
+    async def create_file(self, file, purpose):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = file[1].decode()
+        return SimpleNamespace(id=file_id)
+
+    async def file_content(self, file_id):
+        return SimpleNamespace(text=self.files[file_id])
+
+    async def create_batch(self, input_file_id, endpoint, completion_window):
+        self.batches.append([json.loads(line) for line in self.files[input_file_id].splitlines()])
+        return SimpleNamespace(id=f"batch-{len(self.batches) - 1}", status="validating")
+
+    async def retrieve_batch(self, batch_id):
+        requests = self.batches[int(batch_id.split("-")[1])]
+        succeeded = [r for r in requests if r["custom_id"] not in self.failing_ids]
+        failed = [r for r in requests if r["custom_id"] in self.failing_ids]
+        output_file_id = error_file_id = None
+        if succeeded:
+            output_file_id = f"file-{len(self.files)}"
+            self.files[output_file_id] = "\n".join(json.dumps({
+                "custom_id": r["custom_id"],
+                "response": {"status_code": 200, "body": {"data": [{"embedding": [0.5]}]}},
+                "error": None
+            }) for r in succeeded)
+        if failed:
+            error_file_id = f"file-{len(self.files)}"
+            self.files[error_file_id] = "\n".join(json.dumps({
+                "custom_id": r["custom_id"],
+                "response": {"status_code": 400, "body": {"error": {"message": "bad input"}}},
+                "error": None
+            }) for r in failed)
+        return SimpleNamespace(
+            id=batch_id,
+            status="completed",
+            output_file_id=output_file_id,
+            error_file_id=error_file_id
+        )
+
+@pytest.mark.asyncio
+async def test_process_directory_batch(document_processor, tmp_path):
+    """Test processing a directory through the Batch API."""
+    file_path = tmp_path / "doc.md"
+    file_path.write_text("First sentence.")
+    batch_api = FakeBatchAPI(document_processor.client)
+    
+    results = await document_processor.process_directory_batch(str(tmp_path), poll_interval=0)
+    
+    assert batch_api.batches[0][0]["url"] == "/v1/embeddings"
+    assert len(results) == 1
+    assert results[0]["chunks"] == ["First sentence."]
+    assert results[0]["embeddings"].tolist() == [[0.5]]
+    assert results[0]["metadata"][0]["source"] == str(file_path)
+
+@pytest.mark.asyncio
+async def test_process_directory_batch_cache(tmp_path):
+    """Test that batch ingest skips cached chunks and caches new embeddings."""
+    processor = DocumentProcessor("test-api-key", cache_dir=str(tmp_path / "cache"))
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    (documents / "a.md").write_text("Content of a.")
+    processor.client.embeddings.create = AsyncMock(
+        side_effect=lambda model, input: fake_embeddings_response(input)
+    )
+    await processor.generate_embeddings(["Content of a."])
+    (documents / "b.md").write_text("Content of b.")
+    batch_api = FakeBatchAPI(processor.client)
+    
+    results = await processor.process_directory_batch(str(documents), poll_interval=0)
+    
+    assert [[r["body"]["input"] for r in requests] for requests in batch_api.batches] == [["Content of b."]]
+    embeddings = {r["chunks"][0]: r["embeddings"].tolist() for r in results}
+    assert embeddings == {"Content of a.": [[13.0]], "Content of b.": [[0.5]]}
+    
+    processor.client.embeddings.create = AsyncMock(side_effect=RuntimeError("not cached"))
+    assert (await processor.generate_embeddings(["Content of b."])).tolist() == [[0.5]]
+
+@pytest.mark.asyncio
+async def test_process_directory_batch_retries(tmp_path):
+    """Test that transient errors from Batch API calls are retried."""
+    document_processor = DocumentProcessor("test-api-key")
+    (tmp_path / "doc.md").write_text("First sentence.")
+    batch_api = FakeBatchAPI(document_processor.client)
+    request = httpx.Request("GET", "https://api.openai.com/v1/batches/batch-0")
+    attempts = []
+
+    async def retrieve(batch_id):
+        attempts.append(batch_id)
+        if len(attempts) == 1:
+            raise APIConnectionError(request=request)
+        return await batch_api.retrieve_batch(batch_id)
+
+    document_processor.client.batches.retrieve = retrieve
+    
+    results = await document_processor.process_directory_batch(str(tmp_path), poll_interval=0)
+    
+    assert attempts == ["batch-0", "batch-0"]
+    assert results[0]["embeddings"].tolist() == [[0.5]]
+
+@pytest.mark.asyncio
+async def test_process_directory_batch_shards(document_processor, tmp_path, monkeypatch):
+    """Test that requests beyond the per-batch limit are split across jobs."""
+    monkeypatch.setattr("server.document_processor.BATCH_MAX_REQUESTS", 2)
+    for name in ["a.md", "b.md", "c.md"]:
+        (tmp_path / name).write_text(f"Content of {name}.")
+    batch_api = FakeBatchAPI(document_processor.client)
+    
+    results = await document_processor.process_directory_batch(str(tmp_path), poll_interval=0)
+    
+    assert [len(requests) for requests in batch_api.batches] == [2, 1]
+    assert [result["embeddings"].tolist() for result in results] == [[[0.5]]] * 3
+
+@pytest.mark.asyncio
+async def test_process_directory_batch_failures(document_processor, tmp_path):
+    """Test that failed batch requests are reported from the error file."""
+    (tmp_path / "a.md").write_text("Content of a.")
+    (tmp_path / "b.md").write_text("Content of b.")
+    FakeBatchAPI(document_processor.client, failing_ids=[f"{tmp_path / 'b.md'}:0"])
+    
+    with pytest.raises(RuntimeError, match="1 embedding requests"):
+        await document_processor.process_directory_batch(str(tmp_path), poll_interval=0)
+    
+    FakeBatchAPI(document_processor.client, failing_ids=[
+        f"{tmp_path / 'a.md'}:0", f"{tmp_path / 'b.md'}:0"
+    ])
+    with pytest.raises(RuntimeError, match="2 embedding requests"):
+        await document_processor.process_directory_batch(str(tmp_path), poll_interval=0)
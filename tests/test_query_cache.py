@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+from server.query_cache import QueryCache
+
+@pytest.fixture
+def query_cache():
+    """Create a QueryCache instance."""
+    return QueryCache(max_size=2, ttl=60, similarity_threshold=0.97)
+
+@pytest.fixture
+def sample_results():
+    """Sample search results for testing."""
+    return {
+        "documents": ["This is the first test chunk."],
+        "metadatas": [{"source": "test1.md", "chunk_index": 0, "last_updated": "123456"}],
+        "distances": [0.1]
+    }
+
+def test_embedding_exact_match(query_cache):
+    """Test that embeddings are cached by normalized query text."""
+    embedding = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+    query_cache.put_embedding("What is RAG?", embedding)
+
+    assert query_cache.get_embedding("  what is rag?  ") is embedding
+    assert query_cache.get_embedding("What is a vector store?") is None
+
+def test_embedding_lru_eviction(query_cache):
+    """Test that the least recently used embedding is evicted."""
+    query_cache.put_embedding("first", np.array([1.0]))
+    query_cache.put_embedding("second", np.array([2.0]))
+    query_cache.get_embedding("first")
+    query_cache.put_embedding("third", np.array([3.0]))
+
+    assert query_cache.get_embedding("first") is not None
+    assert query_cache.get_embedding("second") is None
+    assert query_cache.get_embedding("third") is not None
+
+def test_embedding_ttl():
+    """Test that expired embeddings are not returned."""
+    query_cache = QueryCache(ttl=-1)
+    query_cache.put_embedding("query", np.array([1.0]))
+
+    assert query_cache.get_embedding("query") is None
+
+def test_semantic_results_match(query_cache, sample_results):
+    """Test that results are reused for semantically similar queries."""
+    query_cache.put_results(np.array([1.0, 0.0, 0.0]), 3, sample_results)
+
+    assert query_cache.get_results(np.array([0.99, 0.01, 0.0]), 3) is sample_results
+    assert query_cache.get_results(np.array([0.99, 0.01, 0.0]), 5) is None
+    assert query_cache.get_results(np.array([0.0, 1.0, 0.0]), 3) is None
+
+def test_clear_results(query_cache, sample_results):
+    """Test that cached results can be invalidated."""
+    query_cache.put_results(np.array([1.0, 0.0, 0.0]), 3, sample_results)
+    query_cache.clear_results()
+
+    assert query_cache.get_results(np.array([1.0, 0.0, 0.0]), 3) is None
+
+def test_stale_results_not_cached(query_cache, sample_results):
+    """Test that results from a search overlapping a write are not cached."""
+    generation = query_cache.generation
+    query_cache.clear_results()
+    query_cache.put_results(np.array([1.0, 0.0, 0.0]), 3, sample_results, generation)
+
+    assert query_cache.get_results(np.array([1.0, 0.0, 0.0]), 3) is None
+
+    query_cache.put_results(np.array([1.0, 0.0, 0.0]), 3, sample_results, query_cache.generation)
+    assert query_cache.get_results(np.array([1.0, 0.0, 0.0]), 3) is sample_results
@@ -1,76 +1,138 @@
 import pytest
 import os
-import shutil
-import tempfile
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Dict, Any
+from uuid import uuid4
 from server.vector_store import VectorStore
 
-@pytest.fixture
-def temp_db_dir():
-    """Create a temporary directory for ChromaDB storage."""
-    temp_dir = tempfile.mkdtemp()
-    yield temp_dir
-    shutil.rmtree(temp_dir)
-
-@pytest.fixture
+@pytest.fixture(scope="module")
 def vector_store(temp_db_dir):
-    """Create a VectorStore instance with temporary storage."""
-    return VectorStore(persist_directory=temp_db_dir)
+    """Create a VectorStore instance shared by all tests in the module."""
+    store = VectorStore(persist_directory=temp_db_dir, allow_reset=True)
+    yield store
+    store.client.reset()
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def _reset(vector_store):
+    """Empty the shared collection after each test."""
+    yield
+    vector_store.clear_collection()
+
+@dataclass
+class Corpus:
+    """Sample documents with their ids precomputed once."""
+    ids: List[str]
+    chunks: List[str]
+    embeddings: np.ndarray
+    metadata: List[Dict[str, Any]]
+
+@pytest.fixture(scope="module")
 def sample_documents():
     """Sample documents for testing."""
-    return {
-        "chunks": [
+    base = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+    metadata = [
+        {"source": "test1.md", "chunk_index": 0, "last_updated": "123456"},
+        {"source": "test1.md", "chunk_index": 1, "last_updated": "123456"},
+        {"source": "test1.md", "chunk_index": 2, "last_updated": "123456"}
+    ]
+    return Corpus(
+        ids=[f"{meta['source']}_{meta['chunk_index']}" for meta in metadata],
+        chunks=[
             "This is the first test chunk.",
             "This is the second test chunk.",
             "This is the third test chunk."
         ],
-        "embeddings": [
-            [0.1] * 1536,  # Mock embeddings with correct dimension
-            [0.2] * 1536,
-            [0.3] * 1536
-        ],
-        "metadata": [
-            {"source": "test1.md", "chunk_index": 0, "last_updated": "123456"},
-            {"source": "test1.md", "chunk_index": 1, "last_updated": "123456"},
-            {"source": "test1.md", "chunk_index": 2, "last_updated": "123456"}
-        ]
-    }
+        # Mock embeddings with correct dimension, one contiguous float32 row each
+        embeddings=np.repeat(base[:, None], 1536, axis=1),
+        metadata=metadata
+    )
+
+@pytest.fixture(scope="module")
+def populated_store(temp_db_dir, sample_documents):
+    """Separate collection holding the sample documents, for read-only tests."""
+    store = VectorStore(
+        persist_directory=temp_db_dir,
+        collection_name="populated",
+        allow_reset=True
+    )
+    store.add_documents(
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
+    )
+    return store
+
+@pytest.fixture
+def fresh_store(temp_db_dir, sample_documents):
+    """Freshly named collection holding the sample documents, for mutating tests."""
+    store = VectorStore(
+        persist_directory=temp_db_dir,
+        collection_name=f"test_{uuid4().hex}",
+        allow_reset=True
+    )
+    store.add_documents(
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
+    )
+    yield store
+    store.client.delete_collection(store.collection.name)
 
 def test_vector_store_initialization(temp_db_dir):
     """Test VectorStore initialization and collection creation."""
-    store = VectorStore(persist_directory=temp_db_dir)
+    store = VectorStore(persist_directory=temp_db_dir, allow_reset=True)
     assert store.client is not None
     assert store.collection is not None
     assert os.path.exists(temp_db_dir)
 
+def test_hnsw_parameters(tmp_path):
+    """Test that HNSW parameters are applied to a new collection."""
+    store = VectorStore(persist_directory=str(tmp_path), hnsw_m=32, hnsw_ef_search=64)
+    assert store.collection.metadata["hnsw:space"] == "cosine"
+    assert store.collection.metadata["hnsw:M"] == 32
+    assert store.collection.metadata["hnsw:search_ef"] == 64
+    assert store.collection.metadata["hnsw:construction_ef"] == 128
+
 def test_add_documents(vector_store, sample_documents):
     """Test adding documents to the vector store."""
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
     )
     
     # Verify first document was added
-    doc_id = f"{sample_documents['metadata'][0]['source']}_{sample_documents['metadata'][0]['chunk_index']}"
+    doc_id = sample_documents.ids[0]
+    assert vector_store.exists(doc_id)
+    assert not vector_store.exists("missing.md_0")
     result = vector_store.get_document_by_id(doc_id)
     
-    assert result["document"] == sample_documents["chunks"][0]
-    assert result["metadata"] == sample_documents["metadata"][0]
+    assert result["document"] == sample_documents.chunks[0]
+    assert result["metadata"] == sample_documents.metadata[0]
 
-def test_search_similar(vector_store, sample_documents):
-    """Test searching for similar documents."""
-    # Add sample documents
+def test_add_documents_in_batches(vector_store, sample_documents, monkeypatch):
+    """Test that large inputs are split across several add calls."""
+    monkeypatch.setattr("server.vector_store.ADD_BATCH_SIZE", 2)
+    
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
     )
     
+    results = vector_store.collection.get()
+    assert len(results["ids"]) == len(sample_documents.chunks)
+
+def test_search_similar(populated_store, sample_documents):
+    """Test searching for similar documents."""
     # Search using first document's embedding
-    results = vector_store.search_similar(
-        query_embedding=sample_documents["embeddings"][0],
+    results = populated_store.search_similar(
+        query_embedding=sample_documents.embeddings[0],
         n_results=2
     )
     
@@ -78,26 +140,19 @@ def test_search_similar(vector_store, sample_documents):
     assert len(results["metadatas"]) == 2
     assert len(results["distances"]) == 2
 
-def test_update_document(vector_store, sample_documents):
+def test_update_document(fresh_store, sample_documents):
     """Test updating a document in the vector store."""
-    # Add initial documents
-    vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
-    )
-    
     # Update first document
-    doc_id = f"{sample_documents['metadata'][0]['source']}_{sample_documents['metadata'][0]['chunk_index']}"
+    doc_id = sample_documents.ids[0]
     updated_chunk = "This is an updated chunk."
-    updated_embedding = [0.5] * 1536
+    updated_embedding = np.full(1536, 0.5, dtype=np.float32)
     updated_metadata = {
         "source": "test1.md",
         "chunk_index": 0,
         "last_updated": "123457"
     }
     
-    vector_store.update_document(
+    fresh_store.update_document(
         document_id=doc_id,
         chunk=updated_chunk,
         embedding=updated_embedding,
@@ -105,56 +160,59 @@ def test_update_document(vector_store, sample_documents):
     )
     
     # Verify update
-    result = vector_store.get_document_by_id(doc_id)
+    result = fresh_store.get_document_by_id(doc_id)
     assert result["document"] == updated_chunk
     assert result["metadata"] == updated_metadata
 
-def test_delete_document(vector_store, sample_documents):
+def test_delete_document(fresh_store, sample_documents):
     """Test deleting a document from the vector store."""
-    # Add initial documents
-    vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
-    )
-    
     # Delete first document
-    doc_id = f"{sample_documents['metadata'][0]['source']}_{sample_documents['metadata'][0]['chunk_index']}"
-    vector_store.delete_document(doc_id)
+    doc_id = sample_documents.ids[0]
+    fresh_store.delete_document(doc_id)
     
     # Verify deletion
-    with pytest.raises(Exception):
-        vector_store.get_document_by_id(doc_id)
+    assert not fresh_store.exists(doc_id)
 
-def test_clear_collection(vector_store, sample_documents):
-    """Test clearing all documents from the collection."""
-    # Add initial documents
+def test_delete_by_source(vector_store, sample_documents):
+    """Test deleting all chunks of a source document."""
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks + ["Other chunk."],
+        embeddings=np.vstack([sample_documents.embeddings, np.full((1, 1536), 0.4, dtype=np.float32)]),
+        metadata=sample_documents.metadata + [
+            {"source": "test2.md", "chunk_index": 0, "last_updated": "123456"}
+        ]
     )
     
+    assert vector_store.delete_by_source("test1.md") == len(sample_documents.chunks)
+    assert vector_store.delete_by_source("missing.md") == 0
+    
+    results = vector_store.collection.get()
+    assert results["ids"] == ["test2.md_0"]
+
+def test_clear_collection(fresh_store, sample_documents):
+    """Test clearing all documents from the collection."""
     # Clear collection
-    vector_store.clear_collection()
+    fresh_store.clear_collection()
     
     # Verify all documents are removed
-    with pytest.raises(Exception):
-        doc_id = f"{sample_documents['metadata'][0]['source']}_{sample_documents['metadata'][0]['chunk_index']}"
-        vector_store.get_document_by_id(doc_id)
+    doc_id = sample_documents.ids[0]
+    assert not fresh_store.exists(doc_id)
 
-def test_search_with_metadata_filter(vector_store, sample_documents):
-    """Test searching with metadata filters."""
-    # Add initial documents
-    vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
-    )
+def test_list_chunks_and_count(populated_store, sample_documents):
+    """Test listing chunk metadata, optionally with content, and counting chunks."""
+    listing = populated_store.list_chunks()
+    with_content = populated_store.list_chunks(include_content=True)
     
+    assert sorted(listing) == ["metadatas"]
+    assert sorted(meta["chunk_index"] for meta in listing["metadatas"]) == [0, 1, 2]
+    assert sorted(with_content["documents"]) == sorted(sample_documents.chunks)
+    assert populated_store.count() == len(sample_documents.chunks)
+
+def test_search_with_metadata_filter(populated_store, sample_documents):
+    """Test searching with metadata filters."""
     # Search with metadata filter
-    results = vector_store.search_similar(
-        query_embedding=sample_documents["embeddings"][0],
+    results = populated_store.search_similar(
+        query_embedding=sample_documents.embeddings[0],
         n_results=3,
         metadata_filter={"source": "test1.md"}
     )
@@ -166,9 +224,10 @@ def test_list_collections_and_embeddings(vector_store, sample_documents):
     """Test listing all collections and embeddings."""
     # Add initial documents
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
     )
     
     # List collections and embeddings
@@ -177,15 +236,15 @@ def test_list_collections_and_embeddings(vector_store, sample_documents):
     assert "documents" in result
     collection_data = result["documents"]
     
-    assert collection_data["count"] == len(sample_documents["chunks"])
-    assert len(collection_data["ids"]) == len(sample_documents["chunks"])
-    assert len(collection_data["metadatas"]) == len(sample_documents["chunks"])
+    assert collection_data["count"] == len(sample_documents.chunks)
+    assert len(collection_data["ids"]) == len(sample_documents.chunks)
+    assert len(collection_data["metadatas"]) == len(sample_documents.chunks)
     
     if "embeddings" in collection_data:
-        assert len(collection_data["embeddings"]) == len(sample_documents["chunks"])
+        assert len(collection_data["embeddings"]) == len(sample_documents.chunks)
         # Check if the embeddings match
         for i, embedding in enumerate(collection_data["embeddings"]):
-            assert embedding == sample_documents["embeddings"][i]
+            np.testing.assert_allclose(embedding, sample_documents.embeddings[i])
     else:
         print("Note: Embeddings are not available in the collection data.")
 
@@ -193,9 +252,10 @@ def test_clear_all_embeddings(vector_store, sample_documents):
     """Test clearing all embeddings from all collections."""
     # Add initial documents
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
     )
     
     # Clear all embeddings
@@ -209,9 +269,10 @@ def test_add_documents_after_clearing(vector_store, sample_documents):
     """Test adding documents after clearing all embeddings."""
     # Add initial documents
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
     )
     
     # Clear all embeddings
@@ -219,17 +280,36 @@ def test_add_documents_after_clearing(vector_store, sample_documents):
     
     # Add documents again
     vector_store.add_documents(
-        chunks=sample_documents["chunks"],
-        embeddings=sample_documents["embeddings"],
-        metadata=sample_documents["metadata"]
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
     )
     
     # Verify documents were added successfully
     results = vector_store.collection.get()
-    assert len(results["ids"]) == len(sample_documents["chunks"])
+    assert len(results["ids"]) == len(sample_documents.chunks)
     
     # Verify first document was added correctly
-    doc_id = f"{sample_documents['metadata'][0]['source']}_{sample_documents['metadata'][0]['chunk_index']}"
+    doc_id = sample_documents.ids[0]
     result = vector_store.get_document_by_id(doc_id)
-    assert result["document"] == sample_documents["chunks"][0]
-    assert result["metadata"] == sample_documents["metadata"][0]
\ No newline at end of file
+    assert result["document"] == sample_documents.chunks[0]
+    assert result["metadata"] == sample_documents.metadata[0]
+
+@pytest.mark.asyncio
+async def test_async_wrappers(vector_store, sample_documents):
+    """Test the async wrappers around the synchronous store methods."""
+    await vector_store.aadd_documents(
+        chunks=sample_documents.chunks,
+        embeddings=sample_documents.embeddings,
+        metadata=sample_documents.metadata,
+        ids=sample_documents.ids
+    )
+    
+    results = await vector_store.asearch_similar(
+        query_embedding=sample_documents.embeddings[0],
+        n_results=2
+    )
+    assert len(results["documents"]) == 2
+    
+    assert await vector_store.adelete_by_source("test1.md") == len(sample_documents.chunks)